@@ -0,0 +1,213 @@
+import hashlib
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+from rdflib import BNode, Graph, URIRef
+from rdflib.compare import to_canonical_graph
+
+from croissant_rdf.utils import logger
+
+
+def document_key(doc: Any) -> Optional[str]:
+    """Get a key identifying the dataset described by a Croissant JSON-LD document across harvests.
+
+    Uses the `@id` of the document, or its `url`, or its `name`. Returns None if none is defined.
+    """
+    if isinstance(doc, list):
+        doc = doc[0] if doc else {}
+    if not isinstance(doc, dict):
+        return None
+    for prop in ("@id", "url", "name"):
+        value = doc.get(prop)
+        if isinstance(value, str) and value:
+            return value
+    return None
+
+
+def canonical_graph(g: Graph, key: str, base_url: str) -> Tuple[Graph, List[str]]:
+    """Canonicalize the graph of a document, skolemizing its blank nodes so they can be deleted from a triplestore.
+
+    Blank nodes are replaced by IRIs under `{base_url}.well-known/genid/`, derived from the document key
+    and from the canonical blank node labels, which only depend on the content of the graph.
+
+    Args:
+        g (Graph): The graph of a single document.
+        key (str): The key of the document, used to keep skolem IRIs unique across documents.
+        base_url (str): The base URL of the generated RDF.
+
+    Returns:
+        Tuple[Graph, List[str]]: The skolemized graph, and its triples as sorted N-Triples lines.
+    """
+    genid = f"{base_url}.well-known/genid/{hashlib.sha256(key.encode()).hexdigest()[:16]}-"
+
+    def skolemize(term):
+        return URIRef(genid + str(term)) if isinstance(term, BNode) else term
+
+    skolemized = Graph()
+    for s, p, o in to_canonical_graph(g):
+        skolemized.add((skolemize(s), p, skolemize(o)))
+    lines = sorted(line for line in skolemized.serialize(format="nt").splitlines() if line.strip())
+    return skolemized, lines
+
+
+class Changeset:
+    """Track the documents of a harvest against the state of the previous harvest, to write the changes between them.
+
+    The state is a SQLite file storing, for each document key, the content hash of the document, and an index
+    of the N-Triples of its canonical triples by triple and by key. Only documents whose hash changed produce
+    deletes and inserts in the changeset, so the cost of an update depends on the amount of change.
+    """
+
+    def __init__(self, state_path: str, delete_missing: bool = False):
+        """Open (and create if needed) the state of the previous harvest.
+
+        Args:
+            state_path (str): Path to the SQLite file storing the state between harvests.
+            delete_missing (bool): Delete the documents of the previous harvest missing from this one. Only use this
+                when the harvests cover the same datasets, since a failed fetch would also delete the dataset.
+        """
+        self.state_path = state_path
+        self.delete_missing = delete_missing
+        self.conn = sqlite3.connect(state_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS documents (key TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        # Triples are looked up by document, and by value to check which documents still produce them
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS triples (triple TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (triple, key)) "
+            "WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS triples_key ON triples (key)")
+        self.documents: Dict[str, Tuple[str, List[str]]] = {}
+
+    def close(self) -> None:
+        """Close the connection to the state database."""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, key: Optional[str], lines: List[str]) -> None:
+        """Add a document of the new harvest, as the sorted N-Triples lines of its canonical triples.
+
+        Documents without key are tracked by content hash, so a change is seen as a removal and an addition.
+        """
+        digest = hashlib.sha256("\n".join(lines).encode()).hexdigest()
+        self.documents[key or digest] = (digest, lines)
+
+    def diff(self) -> Tuple[List[str], List[str], Dict[str, int]]:
+        """Compare the new harvest with the stored state.
+
+        Triples still produced by another document of the new harvest, or by a document missing from this harvest
+        that stays in the state, are never deleted, since datasets can share nodes (e.g. a license, or a relative
+        `@id` resolved against the same base URL). Only the candidate deletes are looked up in the state, the
+        triples of the documents missing from this harvest are not loaded.
+
+        Returns:
+            Tuple[List[str], List[str], Dict[str, int]]: The N-Triples lines to delete, the lines to insert,
+                and the number of added, changed, removed and unchanged documents.
+        """
+        deletes: List[str] = []
+        inserts: List[str] = []
+        stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+        for key, (digest, lines) in self.documents.items():
+            previous = self._stored_hash(key)
+            if previous is None:
+                stats["added"] += 1
+                inserts.extend(lines)
+            elif previous != digest:
+                stats["changed"] += 1
+                old_lines = self._stored_triples(key)
+                # Unchanged triples of the document are filtered from the deletes below
+                deletes.extend(old_lines)
+                old_lines_set = set(old_lines)
+                inserts.extend(line for line in lines if line not in old_lines_set)
+            else:
+                stats["unchanged"] += 1
+        if self.delete_missing:
+            for key in self._missing_keys():
+                stats["removed"] += 1
+                deletes.extend(self._stored_triples(key))
+        if deletes:
+            harvested = {line for _digest, lines in self.documents.values() for line in lines}
+            deletes = [line for line in deletes if line not in harvested and not self._kept_in_state(line)]
+        return deletes, inserts, stats
+
+    def _stored_hash(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT hash FROM documents WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _stored_triples(self, key: str) -> List[str]:
+        rows = self.conn.execute("SELECT triple FROM triples WHERE key = ? ORDER BY triple", (key,))
+        return [row[0] for row in rows]
+
+    def _missing_keys(self) -> List[str]:
+        return sorted(key for (key,) in self.conn.execute("SELECT key FROM documents") if key not in self.documents)
+
+    def _kept_in_state(self, line: str) -> bool:
+        """Check if a triple is also produced by a document missing from this harvest that stays in the state."""
+        if self.delete_missing:
+            return False
+        rows = self.conn.execute("SELECT key FROM triples WHERE triple = ?", (line,))
+        return any(key not in self.documents for (key,) in rows)
+
+    def write(self, fname: str) -> Dict[str, int]:
+        """Write the changeset to a file, then save the new harvest as the state for the next run.
+
+        The changeset is written as SPARQL Update if the file extension is `.ru` or `.rq`, as RDF Patch otherwise.
+
+        Args:
+            fname (str): The path to the changeset file.
+
+        Returns:
+            Dict[str, int]: The number of added, changed, removed and unchanged documents.
+        """
+        deletes, inserts, stats = self.diff()
+        tmp_fname = f"{fname}.tmp"
+        with open(tmp_fname, "w", encoding="utf-8") as f:
+            if os.path.splitext(fname)[1] in (".ru", ".rq"):
+                write_sparql_update(f, deletes, inserts)
+            else:
+                write_rdf_patch(f, deletes, inserts)
+        os.replace(tmp_fname, fname)
+        # The state is only updated once the changeset is safely written
+        with self.conn:
+            for key, (digest, lines) in self.documents.items():
+                if self._stored_hash(key) == digest:
+                    continue
+                self.conn.execute("INSERT OR REPLACE INTO documents (key, hash) VALUES (?, ?)", (key, digest))
+                self.conn.execute("DELETE FROM triples WHERE key = ?", (key,))
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO triples (triple, key) VALUES (?, ?)", [(line, key) for line in lines]
+                )
+            if self.delete_missing:
+                missing = [(key,) for key in self._missing_keys()]
+                self.conn.executemany("DELETE FROM documents WHERE key = ?", missing)
+                self.conn.executemany("DELETE FROM triples WHERE key = ?", missing)
+        logger.info(
+            f"Changeset with {len(deletes)} deletes and {len(inserts)} inserts written to {fname} "
+            f"({', '.join(f'{v} {k}' for k, v in stats.items())} datasets)"
+        )
+        return stats
+
+
+def write_rdf_patch(f, deletes: List[str], inserts: List[str]) -> None:
+    """Write deletes and inserts N-Triples lines as a RDF Patch transaction."""
+    f.write("TX .\n")
+    for line in deletes:
+        f.write(f"D {line}\n")
+    for line in inserts:
+        f.write(f"A {line}\n")
+    f.write("TC .\n")
+
+
+def write_sparql_update(f, deletes: List[str], inserts: List[str]) -> None:
+    """Write deletes and inserts N-Triples lines as a SPARQL Update request."""
+    requests = []
+    if deletes:
+        requests.append("DELETE DATA {\n" + "\n".join(deletes) + "\n}")
+    if inserts:
+        requests.append("INSERT DATA {\n" + "\n".join(inserts) + "\n}")
+    f.write(" ;\n".join(requests) + "\n")
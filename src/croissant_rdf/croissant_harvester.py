@@ -1,15 +1,24 @@
 import argparse
+import contextlib
 import json
+import os
+import re
+import socket
 import time
 from abc import ABC, abstractmethod
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import requests
 from rdflib import Graph, URIRef
 from rich.progress import track
 
+from croissant_rdf.changeset import Changeset, canonical_graph, document_key
+from croissant_rdf.projection import PROFILES, get_projection
+from croissant_rdf.search_index import SearchIndex, assign_dataset_iri
+from croissant_rdf.turtle_writer import write_turtle
 from croissant_rdf.utils import chunk_data, logger
+from croissant_rdf.work_queue import WorkQueue
 
 DEFAULT_BASE_URL = "https://w3id.org/croissant-rdf/data/"
 
@@ -32,6 +41,12 @@ class CroissantHarvester(ABC):
         base_url: str = DEFAULT_BASE_URL,
         serialization: str = "turtle",
         api_url: Optional[str] = None,
+        profile: str = "full",
+        changeset: Optional[str] = None,
+        state: str = "croissant_state.sqlite",
+        delete_missing: bool = False,
+        search_index: Optional[str] = None,
+        serialization_workers: Optional[int] = None,
     ):
         """Initialize a Croissant metadata Harvester instance for a specific provider.
 
@@ -42,6 +57,15 @@ class CroissantHarvester(ABC):
             search (str): Search keywords to filter datasets.
             base_url (str): The base URL for the RDF graph, used as a prefix in generated RDF triples.
             api_url (str): The base URL for the API endpoint to fetch dataset metadata.
+            profile (str): The projection profile used to prune the JSON-LD before converting it to RDF.
+            changeset (str): Write the changes since the previous harvest to this file, as RDF Patch,
+                or as SPARQL Update if the extension is `.ru`. Blank nodes are skolemized when enabled.
+            state (str): The SQLite file storing the harvested triples per dataset, used to compute the changeset.
+            delete_missing (bool): Delete the datasets of the previous harvest that are missing from this one.
+            search_index (str): Build a full-text index of the datasets names, descriptions and keywords in this
+                SQLite file. Datasets without `@id` are then given an IRI under `base_url` instead of a blank node.
+            serialization_workers (int): The number of processes serializing Turtle in parallel, defaults to the
+                number of CPUs. With 1 the whole graph is serialized at once by rdflib.
         """
         self.fname = fname
         self.limit = limit
@@ -50,6 +74,13 @@ class CroissantHarvester(ABC):
         self.serialization = serialization
         self.use_api_key = use_api_key
         self.api_url = api_url if api_url is not None else self.__class__.api_url
+        self.profile = profile
+        self.projection = get_projection(profile)
+        self.changeset = changeset
+        self.state = state
+        self.delete_missing = delete_missing
+        self.search_index = search_index
+        self.serialization_workers = serialization_workers
 
     @abstractmethod
     def fetch_datasets_ids(self) -> List[str]:
@@ -90,66 +121,130 @@ class CroissantHarvester(ABC):
             return f"Error for {dataset_id}: {e!s}"
 
 
-    def fetch_datasets_croissant(self) -> List[Dict]:
-        """Fetch metadata for multiple datasets, using threading where applicable."""
-        try:
-            datasets = self.fetch_datasets_ids()
-            logger.info(f"Retrieved {len(datasets)} datasets ID.")
-        except Exception as e:
-            logger.error(f"Error fetching datasets: {e}")
-            return []
+    def fetch_datasets_croissant(self, datasets: Optional[List[str]] = None) -> List[Dict]:
+        """Fetch metadata for multiple datasets, using threading where applicable.
+
+        Args:
+            datasets (List[str]): The IDs of the datasets to fetch, defaults to all IDs returned by the provider.
+        """
+        if datasets is None:
+            try:
+                datasets = self.fetch_datasets_ids()
+                logger.info(f"Retrieved {len(datasets)} datasets ID.")
+            except Exception as e:
+                logger.error(f"Error fetching datasets: {e}")
+                return []
+        results, errors = self._fetch_croissant_documents(datasets)
+        if errors:
+            logger.warning(
+                f"Error fetching Croissant metadata JSON-LD for {len(errors)} URLs:\n" + "\n".join(errors.values())
+            )
+        return results
+
+    def _fetch_croissant_documents(self, datasets: List[str]) -> Tuple[List[Dict], Dict[str, str]]:
+        """Fetch the metadata of datasets in threads, returning the documents and the error of each failed ID."""
         results = []
-        errors = []
+        errors = {}
         try:
             with ThreadPoolExecutor(max_workers=4) as executor:
                 futures = {executor.submit(self.fetch_dataset_croissant_handler, dataset): dataset for dataset in datasets}
                 for future in track(as_completed(futures), "Fetching datasets metadata", len(futures)):
                     result = future.result()
                     if isinstance(result, str):
-                        errors.append(result)
+                        errors[futures[future]] = result
                     else:
                         results.append(result)
         except KeyboardInterrupt:
             logger.warning("Process interrupted by user. Shutting down...")
             executor.shutdown(wait=False)
             raise
-        if errors:
-            logger.warning(
-                f"Error fetching Croissant metadata JSON-LD for {len(errors)} URLs:\n" + "\n".join(errors)
-            )
-        return results
+        return results, errors
 
-    def convert_to_rdf(self, data) -> str:
+    def convert_to_rdf(self, data, fname: Optional[str] = None, serialization: Optional[str] = None) -> str:
         """Take a JSON-serializable data structure, converts it to RDF using
         JSON-LD format, and serializes it into Turtle format, saving it to the specified file.
 
         Args:
             data (list|dict): The JSON-serializable data structure to convert to RDF.
+            fname (str): The output file, defaults to the harvester `fname`.
+            serialization (str): The output RDF format, defaults to the harvester `serialization`.
 
         Returns:
             str: The path to the generated turtle file.
         """
+        fname = fname or self.fname
+        serialization = serialization or self.serialization
         total_items = len(data)
         chunk_size = total_items // 100 if total_items > 100 else 1
         logger.info(
-            f"Loading Croissant metadata JSON-LD to RDF graph. Total items: {total_items}, Chunk size: {chunk_size}"
+            f"Loading Croissant metadata JSON-LD to RDF graph. Total items: {total_items}, Chunk size: {chunk_size}, "
+            f"Profile: {self.profile}"
         )
         g = Graph()
         g.bind("cr", "http://mlcommons.org/croissant/")
         g.bind("crdf", self.base_url)
-        start_time = time.time()
-        for chunk in track(chunk_data(data, chunk_size), "Parsing data", total_items):
-            for item in chunk:
-                item_json_ld = json.dumps(item)
-                g.parse(data=item_json_ld, format="json-ld", base=URIRef(self.base_url))
+        # Documents are serialized to Turtle in parallel partitions, instead of merging them in one graph
+        workers = self.serialization_workers or os.cpu_count() or 1
+        parallel_turtle = serialization in ("turtle", "ttl") and workers > 1
+        documents: List[List[tuple]] = []
+        with contextlib.ExitStack() as stack:
+            changeset = stack.enter_context(Changeset(self.state, self.delete_missing)) if self.changeset else None
+            index = stack.enter_context(SearchIndex(self.search_index)) if self.search_index else None
+            start_time = time.time()
+            for chunk in track(chunk_data(data, chunk_size), "Parsing data", total_items):
+                for item in chunk:
+                    doc = self._prepare_document(item, index)
+                    if doc is None:
+                        continue
+                    item_json_ld = json.dumps(doc)
+                    if changeset is None and not parallel_turtle:
+                        g.parse(data=item_json_ld, format="json-ld", base=URIRef(self.base_url))
+                        continue
+                    doc_g = self._parse_document(doc, item_json_ld, g, changeset)
+                    if parallel_turtle:
+                        # Plain triples take much less memory than a graph with its indexes
+                        documents.append(list(doc_g))
+                    else:
+                        g += doc_g
 
-        logger.info(
-            f"Parsing completed in {time.time() - start_time:.2f}s, writing {len(g)} RDF triples to file {self.fname}"
-        )
-        start_time = time.time()
-        g.serialize(destination=self.fname, format=self.serialization)
-        logger.info(f"Serialization completed in {time.time() - start_time:.2f}s")
-        return self.fname
+            if index is not None:
+                index.flush()
+                logger.info(f"Search index {self.search_index} contains {len(index)} datasets")
+            if parallel_turtle:
+                # Triples shared by several documents are written, and counted, once per document
+                n_triples = f"{sum(len(doc) for doc in documents)} RDF triples (total of {len(documents)} documents)"
+            else:
+                n_triples = f"{len(g)} RDF triples"
+            logger.info(f"Parsing completed in {time.time() - start_time:.2f}s, writing {n_triples} to file {fname}")
+            start_time = time.time()
+            if parallel_turtle:
+                n_partitions = write_turtle(documents, fname, g.namespace_manager, workers)
+                logger.info(f"Serialization of {n_partitions} partitions completed in {time.time() - start_time:.2f}s")
+            else:
+                g.serialize(destination=fname, format=serialization)
+                logger.info(f"Serialization completed in {time.time() - start_time:.2f}s")
+            if changeset is not None:
+                changeset.write(self.changeset)
+        return fname
+
+    def _prepare_document(self, item, index: Optional[SearchIndex]):
+        """Prune a document with the projection and index it, None if the whole document is dropped."""
+        doc = self.projection.apply(item) if self.projection is not None else item
+        if doc is not None and index is not None:
+            doc = assign_dataset_iri(doc, self.base_url)
+            index.add(doc, self.base_url)
+        return doc
+
+    def _parse_document(self, doc, item_json_ld: str, g: Graph, changeset: Optional[Changeset]) -> Graph:
+        """Parse a document in its own graph, to be hashed and diffed, or serialized, separately."""
+        doc_g = Graph().parse(data=item_json_ld, format="json-ld", base=URIRef(self.base_url))
+        for prefix, namespace in doc_g.namespaces():
+            g.bind(prefix, namespace, override=False)
+        if changeset is not None:
+            key = document_key(doc)
+            doc_g, lines = canonical_graph(doc_g, key or "", self.base_url)
+            changeset.add(key, lines)
+        return doc_g
 
     def generate_ttl(self) -> str:
         """Fetch datasets and generate a Turtle file.
@@ -175,6 +270,158 @@ class CroissantHarvester(ABC):
             logger.error(f"Error generating TTL file: {e}")
             raise
 
+    def enqueue_datasets(self, queue_path: str, batch_size: int = 100) -> int:
+        """Add the provider dataset IDs to a shared work queue, first step of a distributed harvest.
+
+        Args:
+            queue_path (str): Path to the SQLite file backing the work queue.
+            batch_size (int): The number of datasets handled by a worker per claim.
+
+        Returns:
+            int: The number of batches added to the queue.
+        """
+        # Open the queue first, so a wrong path fails before fetching all the dataset IDs
+        with WorkQueue(queue_path) as queue:
+            datasets = self.fetch_datasets_ids()
+            n_batches = queue.enqueue(datasets, batch_size)
+        logger.info(f"Enqueued {len(datasets)} datasets ID in {n_batches} batches to {queue_path}")
+        return n_batches
+
+    def work(
+        self,
+        queue_path: str,
+        shard_dir: str = ".",
+        worker: Optional[str] = None,
+        lease_seconds: float = 600.0,
+        max_attempts: int = 3,
+    ) -> List[str]:
+        """Claim and convert batches from a shared work queue until it is drained, as a distributed harvest worker.
+
+        Each batch is fetched and converted to a N-Triples shard file named after the batch ID and the worker,
+        so a worker reclaiming an expired batch never overwrites the shard of the worker that lost the lease.
+        The shards of the batches completed by each worker are recorded in the queue.
+
+        A batch with datasets that could not be fetched (e.g. rate limits or server errors) is retried.
+        On its last attempt, it is completed with the datasets fetched, and the others are recorded as missing.
+
+        Args:
+            queue_path (str): Path to the SQLite file backing the work queue.
+            shard_dir (str): The directory where shard files are written.
+            worker (str): Identifier of this worker, defaults to `<hostname>-<pid>`.
+            lease_seconds (float): Time allowed to process a batch before another worker can reclaim it.
+            max_attempts (int): The number of times a batch is tried before it is marked as failed and skipped.
+
+        Returns:
+            List[str]: The absolute paths of the shard files written by this worker.
+        """
+        worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        worker_name = re.sub(r"[^\w.-]", "_", worker)
+        # The shard paths are recorded in the queue, the merge may run in another directory or on another host
+        shard_dir = os.path.abspath(shard_dir)
+        os.makedirs(shard_dir, exist_ok=True)
+        shards = []
+        with WorkQueue(queue_path, max_attempts=max_attempts, create=False) as queue:
+            while True:
+                claimed = queue.claim(worker, lease_seconds)
+                if claimed is None:
+                    break
+                batch_id, datasets = claimed
+                logger.info(f"Worker {worker} claimed batch {batch_id} ({len(datasets)} datasets)")
+                shard = os.path.join(shard_dir, f"shard-{batch_id:06d}-{worker_name}.nt")
+                try:
+                    data, errors = self._fetch_croissant_documents(datasets)
+                    if errors and (not data or queue.attempts(batch_id) < queue.max_attempts):
+                        raise RuntimeError(
+                            f"Failed to fetch {len(errors)} of {len(datasets)} datasets: "
+                            + "; ".join(list(errors.values())[:5])
+                        )
+                    # Write to a temporary file first so a crash never leaves a truncated shard behind
+                    self.convert_to_rdf(data, fname=f"{shard}.tmp", serialization="nt")
+                    os.replace(f"{shard}.tmp", shard)
+                except Exception as e:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(f"{shard}.tmp")
+                    # A batch that cannot be converted must not stop the worker, nor block the queue
+                    failed = queue.fail(batch_id, worker, str(e))
+                    logger.error(
+                        f"Worker {worker} failed to process batch {batch_id}"
+                        f"{', giving up on it' if failed else ', it will be retried'}: {e}"
+                    )
+                    continue
+                except BaseException:
+                    queue.release(batch_id, worker)
+                    raise
+                if queue.complete(batch_id, worker, shard, missing=list(errors)):
+                    shards.append(shard)
+                    if errors:
+                        logger.warning(f"Worker {worker} completed batch {batch_id} without {len(errors)} datasets")
+                else:
+                    os.remove(shard)
+                    logger.warning(f"Worker {worker} lost the lease on batch {batch_id}, its shard is discarded")
+            logger.info(f"Worker {worker} finished, queue status: {queue.counts()}")
+        return shards
+
+    def merge_queue(self, queue_path: str, allow_partial: bool = False) -> str:
+        """Merge the shards of the batches completed in a work queue, final step of a distributed harvest.
+
+        Args:
+            queue_path (str): Path to the SQLite file backing the work queue.
+            allow_partial (bool): Merge even if some batches are still pending or being processed by workers.
+
+        Returns:
+            str: The path to the generated RDF file.
+
+        Raises:
+            FileNotFoundError: If the work queue does not exist.
+            RuntimeError: If the queue is empty, or if batches are not processed yet and `allow_partial` is False.
+        """
+        with WorkQueue(queue_path, create=False) as queue:
+            counts = queue.counts()
+            shards = queue.shards()
+            missing = queue.missing()
+        if not sum(counts.values()):
+            raise RuntimeError(f"Work queue {queue_path} contains no batches, enqueue the datasets first")
+        unfinished = counts["pending"] + counts["leased"]
+        if unfinished and not allow_partial:
+            raise RuntimeError(
+                f"{unfinished} batches of {queue_path} are not processed yet ({counts}), "
+                "wait for the workers to finish or allow a partial merge"
+            )
+        if unfinished:
+            logger.warning(f"Partial merge: {unfinished} batches of {queue_path} are not processed yet")
+        if counts["failed"]:
+            logger.warning(f"{counts['failed']} batches of {queue_path} failed, their datasets are missing")
+        if missing:
+            logger.warning(f"{len(missing)} datasets of {queue_path} could not be fetched: {', '.join(missing[:20])}")
+        return self.merge_shards(shards)
+
+    def merge_shards(self, shards: List[str]) -> str:
+        """Merge N-Triples shard files into the harvester output file, final step of a distributed harvest.
+
+        Args:
+            shards (List[str]): The paths of the shard files, in the order they should be merged.
+
+        Returns:
+            str: The path to the generated RDF file.
+        """
+        start_time = time.time()
+        if self.serialization in ("nt", "ntriples", "nt11"):
+            # N-Triples are line based, shards can be concatenated without parsing
+            with open(self.fname, "wb") as out:
+                for shard in shards:
+                    with open(shard, "rb") as f:
+                        while block := f.read(1 << 20):
+                            out.write(block)
+        else:
+            g = Graph()
+            g.bind("cr", "http://mlcommons.org/croissant/")
+            g.bind("crdf", self.base_url)
+            for shard in track(shards, "Merging shards"):
+                g.parse(shard, format="nt")
+            g.serialize(destination=self.fname, format=self.serialization)
+        logger.info(f"Merged {len(shards)} shards to {self.fname} in {time.time() - start_time:.2f}s")
+        return self.fname
+
     @classmethod
     def cli(cls):
         """Parse command-line arguments and generate a RDF file from harvested Croissant metadata."""
@@ -221,7 +468,113 @@ class CroissantHarvester(ABC):
             default=True,
             help="Use API key for API requests.",
         )
+        parser.add_argument(
+            "--profile",
+            type=str,
+            required=False,
+            default="full",
+            choices=list(PROFILES),
+            help="The projection profile used to prune the Croissant JSON-LD before converting it to RDF.",
+        )
+        parser.add_argument(
+            "--changeset",
+            type=str,
+            required=False,
+            default=None,
+            help="Write the changes since the previous harvest to this file, as RDF Patch (or SPARQL Update for .ru).",
+        )
+        parser.add_argument(
+            "--state",
+            type=str,
+            required=False,
+            default="croissant_state.sqlite",
+            help="The file storing the harvested triples per dataset between runs, used to compute the changeset.",
+        )
+        parser.add_argument(
+            "--delete-missing",
+            action="store_true",
+            help="Delete from the changeset the datasets of the previous harvest missing from this one.",
+        )
+        parser.add_argument(
+            "--search-index",
+            type=str,
+            required=False,
+            default=None,
+            help="Build a full-text index of the datasets names, descriptions and keywords in this SQLite file.",
+        )
+        parser.add_argument(
+            "--serialization-workers",
+            type=int,
+            required=False,
+            default=None,
+            help="The number of processes serializing Turtle in parallel, defaults to the number of CPUs.",
+        )
+        parser.add_argument(
+            "--role",
+            type=str,
+            required=False,
+            default=None,
+            choices=["enqueue", "work", "merge"],
+            help="Run one step of a distributed harvest sharing the work queue given with --queue.",
+        )
+        parser.add_argument(
+            "--queue",
+            type=str,
+            required=False,
+            default="croissant_queue.sqlite",
+            help="Path to the SQLite work queue shared by the distributed harvest steps.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            required=False,
+            default=100,
+            help="The number of datasets per work queue batch.",
+        )
+        parser.add_argument(
+            "--shard-dir",
+            type=str,
+            required=False,
+            default="shards",
+            help="The directory where workers write their N-Triples shards.",
+        )
+        parser.add_argument(
+            "--worker",
+            type=str,
+            required=False,
+            default=None,
+            help="Identifier of the worker, defaults to <hostname>-<pid>.",
+        )
+        parser.add_argument(
+            "--lease",
+            type=float,
+            required=False,
+            default=600.0,
+            help="Seconds a worker has to process a batch before it can be reclaimed by another worker.",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            required=False,
+            default=3,
+            help="The number of times a batch is tried by workers before it is marked as failed.",
+        )
+        parser.add_argument(
+            "--shards",
+            type=str,
+            nargs="*",
+            required=False,
+            default=None,
+            help="Shard files to merge, defaults to the shards of all completed batches in the queue.",
+        )
+        parser.add_argument(
+            "--allow-partial",
+            action="store_true",
+            help="Merge the shards of the completed batches even if other batches are not processed yet.",
+        )
         args = parser.parse_args()
+        if args.changeset and args.role:
+            parser.error("--changeset is not supported for distributed harvests")
 
         harvester = cls(
             fname=args.fname,
@@ -229,8 +582,23 @@ class CroissantHarvester(ABC):
             use_api_key=args.use_api_key,
             search=args.search,
             serialization=args.format,
+            profile=args.profile,
+            changeset=args.changeset,
+            state=args.state,
+            delete_missing=args.delete_missing,
+            search_index=args.search_index,
+            serialization_workers=args.serialization_workers,
         )
-        harvester.generate_ttl()
+        if args.role == "enqueue":
+            harvester.enqueue_datasets(args.queue, args.batch_size)
+        elif args.role == "work":
+            harvester.work(args.queue, args.shard_dir, args.worker, args.lease, args.max_attempts)
+        elif args.role == "merge" and args.shards is not None:
+            harvester.merge_shards(args.shards)
+        elif args.role == "merge":
+            harvester.merge_queue(args.queue, args.allow_partial)
+        else:
+            harvester.generate_ttl()
 
     # # TODO: using async fetching of Croissant metadata with httpx?
     # import asyncio
@@ -0,0 +1,125 @@
+from typing import Any, Dict, Iterable, Optional
+
+
+def local_name(term: str) -> str:
+    """Get the local part of a compact JSON-LD term or IRI, e.g. `cr:field` or `http://mlcommons.org/croissant/field` to `field`."""
+    for sep in ("#", "/", ":"):
+        term = term.rsplit(sep, 1)[-1]
+    return term
+
+
+class Projection:
+    """Prune Croissant JSON-LD documents before they are parsed to RDF, to only keep the subtrees a deployment queries.
+
+    Properties and types are matched on their local name, so `cr:field`, `field` and
+    `http://mlcommons.org/croissant/field` all match `field`, whatever the context of the document.
+    JSON-LD keywords (`@context`, `@id`, `@type`...) are always kept.
+    """
+
+    def __init__(
+        self,
+        keep_properties: Optional[Iterable[str]] = None,
+        drop_properties: Iterable[str] = (),
+        drop_types: Iterable[str] = (),
+    ):
+        """Define which subtrees of the documents are kept.
+
+        Args:
+            keep_properties (Iterable[str]): Properties kept on the root node of each document, all if None.
+            drop_properties (Iterable[str]): Properties removed from any node of the documents.
+            drop_types (Iterable[str]): Types of the nodes removed from the documents.
+        """
+        self.keep_properties = set(keep_properties) if keep_properties is not None else None
+        self.drop_properties = set(drop_properties)
+        self.drop_types = set(drop_types)
+
+    def apply(self, doc: Any) -> Any:
+        """Return a pruned copy of a JSON-LD document, or None if its root node is dropped.
+
+        The input document is not modified.
+        """
+        if isinstance(doc, list):
+            return [self.apply(item) for item in doc if not self._is_dropped_type(item)]
+        if not isinstance(doc, dict):
+            return doc
+        if self._is_dropped_type(doc):
+            return None
+        return self._prune_root(doc)
+
+    def _prune_root(self, node: Dict[str, Any]) -> Dict[str, Any]:
+        pruned = {}
+        for key, value in node.items():
+            if key == "@context":
+                pruned[key] = value
+            elif key == "@graph":
+                # Each node of a top-level graph is a root node of the document
+                nodes = value if isinstance(value, list) else [value]
+                pruned[key] = [
+                    self._prune_root(n) if isinstance(n, dict) else n for n in nodes if not self._is_dropped_type(n)
+                ]
+            elif self._keep(key) and (
+                key.startswith("@") or self.keep_properties is None or local_name(key) in self.keep_properties
+            ):
+                pruned[key] = self._prune(value)
+        return pruned
+
+    def _keep(self, key: str) -> bool:
+        return key.startswith("@") or local_name(key) not in self.drop_properties
+
+    def _is_dropped_type(self, node: Any) -> bool:
+        if not self.drop_types or not isinstance(node, dict):
+            return False
+        types = node.get("@type", [])
+        types = types if isinstance(types, list) else [types]
+        return any(local_name(t) in self.drop_types for t in types)
+
+    def _prune(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self._prune(item) for item in value if not self._is_dropped_type(item)]
+        if not isinstance(value, dict):
+            return value
+        return {key: v if key == "@context" else self._prune(v) for key, v in value.items() if self._keep(key)}
+
+
+PROFILES: Dict[str, Optional[Projection]] = {
+    # Keep everything
+    "full": None,
+    # Dataset-level metadata used for catalog search, without the RecordSets describing the data structure
+    "catalog-only": Projection(
+        keep_properties=[
+            "name",
+            "alternateName",
+            "description",
+            "keywords",
+            "creator",
+            "publisher",
+            "license",
+            "url",
+            "sameAs",
+            "identifier",
+            "version",
+            "citeAs",
+            "citation",
+            "conformsTo",
+            "inLanguage",
+            "dateCreated",
+            "dateModified",
+            "datePublished",
+            "distribution",
+        ],
+    ),
+    # Keep the RecordSets but not the per-column fields and how they are extracted from the files
+    "no-fields": Projection(drop_properties=["field", "source", "extract", "transform", "references", "data"]),
+}
+
+
+def get_projection(profile: str) -> Optional[Projection]:
+    """Get the projection of a named profile, None if the documents are not pruned.
+
+    Raises:
+        ValueError: If the profile does not exist.
+    """
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown projection profile `{profile}`, choose one of: {', '.join(PROFILES)}") from None
@@ -0,0 +1,185 @@
+import argparse
+import sqlite3
+from typing import Any, List, Tuple
+from urllib.parse import quote, urljoin
+
+from croissant_rdf.changeset import document_key
+from croissant_rdf.utils import logger
+
+INDEXED_PROPERTIES = ("name", "description", "keywords")
+
+
+def _root_nodes(doc: Any) -> List[dict]:
+    return [node for node in (doc if isinstance(doc, list) else [doc]) if isinstance(node, dict)]
+
+
+def _text(value: Any) -> str:
+    """Flatten a JSON-LD value (string, list, value object or language map) to plain text."""
+    if isinstance(value, list):
+        return " ".join(_text(v) for v in value)
+    if isinstance(value, dict):
+        if "@value" in value:
+            return _text(value["@value"])
+        return " ".join(_text(v) for k, v in value.items() if not k.startswith("@"))
+    return str(value) if value is not None else ""
+
+
+def assign_dataset_iri(doc: Any, base_url: str) -> Any:
+    """Give an `@id` under `base_url` to the root nodes of a document that have none, so they are not blank nodes.
+
+    The IRI is derived from the dataset URL (without scheme) or name, e.g. `{base_url}huggingface.co/datasets/org/name`.
+    Returns a copy of the document, the input document is not modified.
+    """
+    nodes = []
+    for node in _root_nodes(doc):
+        key = document_key(node)
+        if "@id" in node or not key:
+            nodes.append(node)
+        else:
+            nodes.append({**node, "@id": base_url + quote(key.split("://", 1)[-1], safe="/")})
+    return nodes if isinstance(doc, list) else (nodes[0] if nodes else doc)
+
+
+class SearchIndex:
+    """Full-text index of datasets names, descriptions and keywords, stored in a SQLite FTS5 sidecar file.
+
+    Each entry maps to the IRI of the dataset in the generated RDF, so keyword lookups can be done in the index
+    and the resulting IRIs joined with SPARQL queries, instead of scanning every literal with `FILTER CONTAINS`.
+    Entries are upserted by IRI, so the index can be updated by successive or distributed harvests. Entries are
+    buffered and written in short transactions of `flush_size` entries, so the write lock is not held while documents
+    are converted and several processes can write to the same index.
+    """
+
+    def __init__(self, path: str, timeout: float = 60.0, flush_size: int = 100):
+        """Open (and create if needed) the index database.
+
+        Args:
+            path (str): Path to the SQLite file backing the index.
+            timeout (float): Seconds to wait for the database lock held by another process.
+            flush_size (int): The number of entries buffered before they are written to the index.
+        """
+        self.path = path
+        self.flush_size = flush_size
+        self.pending: List[tuple] = []
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        try:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS datasets (
+                    id INTEGER PRIMARY KEY, iri TEXT UNIQUE NOT NULL, name TEXT, description TEXT, keywords TEXT
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS datasets_fts USING fts5(
+                    name, description, keywords, content='datasets', content_rowid='id'
+                );
+                CREATE TRIGGER IF NOT EXISTS datasets_ai AFTER INSERT ON datasets BEGIN
+                    INSERT INTO datasets_fts (rowid, name, description, keywords)
+                    VALUES (new.id, new.name, new.description, new.keywords);
+                END;
+                CREATE TRIGGER IF NOT EXISTS datasets_ad AFTER DELETE ON datasets BEGIN
+                    INSERT INTO datasets_fts (datasets_fts, rowid, name, description, keywords)
+                    VALUES ('delete', old.id, old.name, old.description, old.keywords);
+                END;
+                CREATE TRIGGER IF NOT EXISTS datasets_au AFTER UPDATE ON datasets BEGIN
+                    INSERT INTO datasets_fts (datasets_fts, rowid, name, description, keywords)
+                    VALUES ('delete', old.id, old.name, old.description, old.keywords);
+                    INSERT INTO datasets_fts (rowid, name, description, keywords)
+                    VALUES (new.id, new.name, new.description, new.keywords);
+                END;
+                """
+            )
+        except sqlite3.OperationalError as e:
+            self.conn.close()
+            raise RuntimeError(f"Could not create the search index, SQLite must be compiled with FTS5: {e}") from e
+
+    def close(self) -> None:
+        """Close the connection to the index database, entries not flushed yet are discarded."""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # Only write the buffered entries if the conversion succeeded
+        if exc_type is None:
+            self.flush()
+        self.close()
+
+    def flush(self) -> None:
+        """Write the buffered entries to the index, in one transaction."""
+        if not self.pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO datasets (iri, name, description, keywords) VALUES (?, ?, ?, ?) ON CONFLICT(iri) "
+                "DO UPDATE SET name = excluded.name, description = excluded.description, keywords = excluded.keywords",
+                self.pending,
+            )
+        self.pending = []
+
+    def add(self, doc: Any, base_url: str) -> int:
+        """Index the root nodes of a Croissant JSON-LD document that have an `@id`.
+
+        Args:
+            doc (list|dict): The JSON-LD document, see `assign_dataset_iri` to give an `@id` to its root nodes.
+            base_url (str): The base URL used to resolve relative `@id`.
+
+        Returns:
+            int: The number of entries indexed.
+        """
+        rows = [
+            (urljoin(base_url, node["@id"]), *(_text(node.get(prop)) for prop in INDEXED_PROPERTIES))
+            for node in _root_nodes(doc)
+            if isinstance(node.get("@id"), str)
+        ]
+        self.pending.extend(rows)
+        if len(self.pending) >= self.flush_size:
+            self.flush()
+        return len(rows)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """Search the datasets matching a FTS5 query, e.g. `covid`, `name:bio*` or `"protein structure"`.
+
+        Args:
+            query (str): The FTS5 full-text query.
+            limit (int): The maximum number of results.
+
+        Returns:
+            List[Tuple[str, float]]: The IRIs of the matching datasets and their BM25 score, best matches first.
+        """
+        return self.conn.execute(
+            "SELECT datasets.iri, bm25(datasets_fts) AS score FROM datasets_fts "
+            "JOIN datasets ON datasets.id = datasets_fts.rowid WHERE datasets_fts MATCH ? ORDER BY score LIMIT ?",
+            (query, limit),
+        ).fetchall()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM datasets").fetchone()[0]
+
+
+def main():
+    """Search the full-text index built during conversion, and print the IRIs of the matching datasets."""
+    parser = argparse.ArgumentParser(description="Search datasets in a full-text index built by croissant-rdf.")
+    parser.add_argument("query", type=str, help="The full-text query, using the SQLite FTS5 query syntax.")
+    parser.add_argument(
+        "--index",
+        type=str,
+        required=False,
+        default="croissant_search.sqlite",
+        help="The path to the search index file.",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        required=False,
+        default=10,
+        help="The maximum number of results.",
+    )
+    args = parser.parse_args()
+    with SearchIndex(args.index) as index:
+        try:
+            results = index.search(args.query, args.limit)
+        except sqlite3.OperationalError as e:
+            logger.error(f"Invalid search query `{args.query}`: {e}")
+            raise SystemExit(1) from e
+    for iri, _score in results:
+        print(iri)
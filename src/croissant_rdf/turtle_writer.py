@@ -0,0 +1,106 @@
+import contextlib
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+from rdflib import Graph
+from rdflib.namespace import NamespaceManager
+
+
+def _serialize_partition(args: Tuple[List[tuple], List[Tuple[str, str]]]) -> Tuple[List[str], str]:
+    """Serialize a partition of triples to Turtle, returning the `@prefix` lines and the body separately."""
+    triples, namespaces = args
+    g = Graph()
+    for prefix, namespace in namespaces:
+        g.bind(prefix, namespace, override=True, replace=True)
+    for triple in triples:
+        g.add(triple)
+    prefixes, body = [], []
+    for line in g.serialize(format="turtle").splitlines(keepends=True):
+        if line.startswith("@prefix ") and not body:
+            prefixes.append(line)
+        elif body or line.strip():
+            body.append(line)
+    return prefixes, "".join(body)
+
+
+def _partitions(
+    documents: List[List[tuple]], partition_size: int, namespaces: List[Tuple[str, str]]
+) -> Iterator[Tuple[List[tuple], List[Tuple[str, str]]]]:
+    """Build the triples of each partition when it is submitted, releasing the documents it contains."""
+    while documents:
+        docs = documents[:partition_size]
+        del documents[:partition_size]
+        yield [triple for doc in docs for triple in doc], namespaces
+
+
+def write_turtle(
+    documents: List[List[tuple]],
+    fname: str,
+    namespace_manager: NamespaceManager,
+    workers: Optional[int] = None,
+    partition_size: int = 100,
+) -> int:
+    """Serialize documents triples to a Turtle file, pretty-printing partitions of documents in parallel processes.
+
+    Each document is kept whole in a partition, so its blank nodes can still be nested with `[ ]`.
+    The partitions are written in the order of the documents, after one shared `@prefix` header.
+    Only a few partitions per worker are in flight at once, and the documents are removed from
+    the `documents` list as their partition is submitted, so they can be garbage collected.
+
+    Args:
+        documents (List[List[tuple]]): The triples of each document, the list is emptied.
+        fname (str): The path to the output Turtle file.
+        namespace_manager (NamespaceManager): The prefixes used in the output.
+        workers (int): The number of worker processes, defaults to the number of CPUs.
+        partition_size (int): The number of documents serialized together by a worker.
+
+    Returns:
+        int: The number of partitions serialized.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Bind a prefix for each predicate namespace upfront, otherwise partitions would generate conflicting `ns1` prefixes
+    for predicate in {p for doc in documents for _s, p, _o in doc}:
+        with contextlib.suppress(ValueError):
+            namespace_manager.compute_qname(predicate, generate=True)
+    namespaces = [(prefix, str(namespace)) for prefix, namespace in namespace_manager.namespaces()]
+
+    partitions = _partitions(documents, max(partition_size, 1), namespaces)
+    prefixes = set()
+    n_partitions = 0
+    body_fname = f"{fname}.body.tmp"
+    try:
+        # The header is only known once all partitions are serialized, bodies are streamed to a temporary file
+        with open(body_fname, "w", encoding="utf-8") as body_file:
+
+            def write(result: Tuple[List[str], str]) -> None:
+                partition_prefixes, body = result
+                prefixes.update(partition_prefixes)
+                if body:
+                    body_file.write("\n")
+                    body_file.write(body)
+
+            if workers == 1:
+                for partition in partitions:
+                    write(_serialize_partition(partition))
+                    n_partitions += 1
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    in_flight: deque = deque()
+                    for partition in partitions:
+                        in_flight.append(executor.submit(_serialize_partition, partition))
+                        n_partitions += 1
+                        if len(in_flight) >= workers * 2:
+                            write(in_flight.popleft().result())
+                    while in_flight:
+                        write(in_flight.popleft().result())
+
+        with open(fname, "w", encoding="utf-8") as f, open(body_fname, encoding="utf-8") as body_file:
+            f.writelines(sorted(prefixes))
+            shutil.copyfileobj(body_file, f)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(body_fname)
+    return n_partitions
@@ -0,0 +1,221 @@
+import json
+import os
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+
+from croissant_rdf.utils import chunk_data
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class WorkQueue:
+    """Durable queue of dataset ID batches stored in a SQLite file, shared by harvest workers.
+
+    A coordinator enqueues the dataset IDs once, then any number of worker processes claim batches
+    under a time-limited lease. A batch whose lease expires without being completed (e.g. the worker crashed)
+    can be claimed again by another worker, until it reaches `max_attempts` and is marked as failed.
+    When workers run on several hosts the SQLite file must live on a filesystem with working POSIX locks
+    that is visible to all of them.
+    """
+
+    def __init__(self, path: str, timeout: float = 60.0, max_attempts: int = 3, create: bool = True):
+        """Open the queue database.
+
+        Args:
+            path (str): Path to the SQLite file backing the queue.
+            timeout (float): Seconds to wait for the database lock held by another process.
+            max_attempts (int): The number of times a batch is claimed before it is marked as failed.
+            create (bool): Create the queue if needed, workers and merge only open an existing queue,
+                so a wrong or unmounted path is not mistaken for an empty queue.
+
+        Raises:
+            FileNotFoundError: If the directory of the queue does not exist, or if `create` is False
+                and the queue does not exist.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        if not create:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"Work queue {path} does not exist, enqueue the datasets first")
+            self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+            if not self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'batches'"
+            ).fetchone():
+                self.conn.close()
+                raise FileNotFoundError(f"{path} is not a work queue, enqueue the datasets first")
+            return
+        # The directory is not created, it is usually a shared mount that must already exist
+        if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+            raise FileNotFoundError(f"The directory of work queue {path} does not exist")
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS batches (
+                batch_id INTEGER PRIMARY KEY,
+                dataset_ids TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                shard TEXT,
+                error TEXT,
+                missing TEXT
+            )"""
+        )
+
+    def close(self) -> None:
+        """Close the connection to the queue database."""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def enqueue(self, dataset_ids: List[str], batch_size: int = 100) -> int:
+        """Split dataset IDs into batches and add them to the queue.
+
+        Args:
+            dataset_ids (List[str]): The dataset IDs to harvest.
+            batch_size (int): The number of dataset IDs per batch.
+
+        Returns:
+            int: The number of batches added.
+
+        Raises:
+            ValueError: If the queue already contains batches, so the same datasets are not harvested twice.
+        """
+        n_batches = self.conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+        if n_batches:
+            raise ValueError(f"Work queue {self.path} already contains {n_batches} batches, use a new queue file")
+        batches = [(json.dumps(batch),) for batch in chunk_data(dataset_ids, max(batch_size, 1))]
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany("INSERT INTO batches (dataset_ids) VALUES (?)", batches)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return len(batches)
+
+    def claim(self, worker: str, lease_seconds: float = 600.0) -> Optional[Tuple[int, List[str]]]:
+        """Lease the next available batch to a worker.
+
+        A batch is available if it is pending, or if its previous lease expired. An expired batch that was
+        already claimed `max_attempts` times (e.g. it keeps crashing its workers) is marked as failed instead.
+
+        Args:
+            worker (str): Identifier of the worker claiming the batch.
+            lease_seconds (float): How long the worker has to complete the batch before it can be reclaimed.
+
+        Returns:
+            Optional[Tuple[int, List[str]]]: The batch ID and its dataset IDs, or None if no batch is available.
+        """
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock up front so two workers cannot claim the same batch
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "UPDATE batches SET status = ?, error = 'Lease expired' "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, LEASED, now, self.max_attempts),
+            )
+            row = self.conn.execute(
+                "SELECT batch_id, dataset_ids FROM batches WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY batch_id LIMIT 1",
+                (PENDING, LEASED, now),
+            ).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE batches SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE batch_id = ?",
+                (LEASED, worker, now + lease_seconds, row[0]),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return row[0], json.loads(row[1])
+
+    def complete(self, batch_id: int, worker: str, shard: str, missing: Optional[List[str]] = None) -> bool:
+        """Mark a leased batch as done and record the shard file it produced.
+
+        Args:
+            batch_id (int): The ID of the batch.
+            worker (str): Identifier of the worker holding the lease.
+            shard (str): Path to the shard output file, recorded relative to the queue file when it is in the
+                same directory tree, so the shared directory can be mounted at another path by the merge.
+            missing (List[str]): The dataset IDs of the batch that could not be harvested.
+
+        Returns:
+            bool: False if the lease was lost to another worker in the meantime.
+        """
+        cur = self.conn.execute(
+            "UPDATE batches SET status = ?, shard = ?, lease_expires = NULL, missing = ? "
+            "WHERE batch_id = ? AND status = ? AND worker = ?",
+            (DONE, self._shard_path(shard), json.dumps(missing) if missing else None, batch_id, LEASED, worker),
+        )
+        return cur.rowcount == 1
+
+    def fail(self, batch_id: int, worker: str, error: str) -> bool:
+        """Record an error on a leased batch, and give it back to the queue unless it reached `max_attempts`.
+
+        Args:
+            batch_id (int): The ID of the batch.
+            worker (str): Identifier of the worker holding the lease.
+            error (str): The error message.
+
+        Returns:
+            bool: True if the batch is marked as failed and will not be claimed again.
+        """
+        self.conn.execute(
+            "UPDATE batches SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "worker = NULL, lease_expires = NULL, error = ? WHERE batch_id = ? AND status = ? AND worker = ?",
+            (self.max_attempts, FAILED, PENDING, error, batch_id, LEASED, worker),
+        )
+        row = self.conn.execute("SELECT status FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        return row is not None and row[0] == FAILED
+
+    def attempts(self, batch_id: int) -> int:
+        """Get the number of times a batch was claimed."""
+        row = self.conn.execute("SELECT attempts FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def release(self, batch_id: int, worker: str) -> None:
+        """Give back a leased batch so another worker can claim it immediately."""
+        self.conn.execute(
+            "UPDATE batches SET status = ?, worker = NULL, lease_expires = NULL "
+            "WHERE batch_id = ? AND status = ? AND worker = ?",
+            (PENDING, batch_id, LEASED, worker),
+        )
+
+    def shards(self) -> List[str]:
+        """List the absolute paths of the shard files of completed batches, in batch order."""
+        rows = self.conn.execute("SELECT shard FROM batches WHERE status = ? ORDER BY batch_id", (DONE,)).fetchall()
+        return [os.path.join(self._queue_dir(), row[0]) for row in rows]
+
+    def _queue_dir(self) -> str:
+        return os.path.dirname(os.path.abspath(self.path))
+
+    def _shard_path(self, shard: str) -> str:
+        shard = os.path.abspath(shard)
+        relative = os.path.relpath(shard, self._queue_dir())
+        return shard if relative.startswith(os.pardir) else relative
+
+    def missing(self) -> List[str]:
+        """List the dataset IDs that could not be harvested in completed batches, in batch order."""
+        rows = self.conn.execute(
+            "SELECT missing FROM batches WHERE status = ? AND missing IS NOT NULL ORDER BY batch_id", (DONE,)
+        ).fetchall()
+        return [dataset_id for row in rows for dataset_id in json.loads(row[0])]
+
+    def counts(self) -> dict:
+        """Count batches per status."""
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM batches GROUP BY status").fetchall()
+        return {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0, **dict(rows)}
@@ -0,0 +1,83 @@
+from unittest.mock import patch
+
+from rdflib import BNode, Graph
+
+from croissant_rdf.changeset import Changeset
+from croissant_rdf.providers import HuggingfaceHarvester
+
+
+def dataset(name, description):
+    return {
+        "@context": {"@vocab": "https://schema.org/"},
+        "@type": "Dataset",
+        "url": f"https://huggingface.co/datasets/{name}",
+        "name": name,
+        "description": description,
+        "creator": {"@type": "Person", "name": "Jane"},
+    }
+
+
+def harvest(tmp_path, data, changeset, delete_missing=False):
+    fname = str(tmp_path / "output.ttl")
+    harvester = HuggingfaceHarvester(
+        fname=fname,
+        changeset=str(tmp_path / changeset),
+        state=str(tmp_path / "state.sqlite"),
+        delete_missing=delete_missing,
+    )
+    harvester.convert_to_rdf(data)
+    with open(tmp_path / changeset) as f:
+        return Graph().parse(fname, format="ttl"), f.read().splitlines()
+
+
+def test_changeset_rdf_patch(tmp_path):
+    g, patch = harvest(tmp_path, [dataset("a", "first"), dataset("b", "second")], "run1.rdfp")
+    # Blank nodes are skolemized so they can be deleted later
+    assert not any(isinstance(term, BNode) for triple in g for term in triple)
+    assert patch[0] == "TX ."
+    assert patch[-1] == "TC ."
+    assert len([line for line in patch if line.startswith("A ")]) == len(g)
+
+    # Same content, nothing to change
+    _, patch = harvest(tmp_path, [dataset("b", "second"), dataset("a", "first")], "run2.rdfp")
+    assert patch == ["TX .", "TC ."]
+
+    # Only the description of `a` changed
+    _, patch = harvest(tmp_path, [dataset("a", "updated"), dataset("b", "second")], "run3.rdfp")
+    assert len(patch) == 4
+    assert patch[1].startswith("D ") and '"first"' in patch[1]
+    assert patch[2].startswith("A ") and '"updated"' in patch[2]
+
+
+def test_changeset_sparql_update_delete_missing(tmp_path):
+    harvest(tmp_path, [dataset("a", "first"), dataset("b", "second")], "run1.ru")
+    _, update = harvest(tmp_path, [dataset("a", "first")], "run2.ru")
+    assert update == [""]
+    _, update = harvest(tmp_path, [dataset("a", "first")], "run3.ru", delete_missing=True)
+    assert update[0] == "DELETE DATA {"
+    assert all("datasets/a" not in line for line in update)
+    assert any('"second"' in line for line in update)
+    assert "INSERT DATA {" not in update
+
+
+def test_changeset_shared_triple_missing_document(tmp_path):
+    def licensed(name, description):
+        return {**dataset(name, description), "license": {"@id": "http://lic/mit", "name": "MIT"}}
+
+    harvest(tmp_path, [licensed("a", "first"), licensed("b", "second")], "run1.rdfp")
+    # `b` failed to be fetched, the license it shares with `a` must stay in the store
+    _, patch = harvest(tmp_path, [dataset("a", "first")], "run2.rdfp")
+    assert any(line.startswith("D ") for line in patch)
+    assert all('"MIT"' not in line for line in patch)
+    _, patch = harvest(tmp_path, [dataset("a", "first"), licensed("b", "second")], "run3.rdfp")
+    assert patch == ["TX .", "TC ."]
+
+
+def test_changeset_missing_documents_not_loaded(tmp_path):
+    harvest(tmp_path, [dataset(name, "first") for name in "abcd"], "run1.rdfp")
+    # A partial refresh only looks up the candidate deletes, not the triples of the datasets missing from it
+    with patch.object(Changeset, "_stored_triples", autospec=True, side_effect=Changeset._stored_triples) as stored:
+        _, patch_lines = harvest(tmp_path, [dataset("a", "updated")], "run2.rdfp")
+    assert [call.args[1] for call in stored.call_args_list] == ["https://huggingface.co/datasets/a"]
+    assert len(patch_lines) == 4
+    assert '"first"' in patch_lines[1]
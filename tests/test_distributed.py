@@ -0,0 +1,180 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from rdflib import Graph
+
+from croissant_rdf.providers import HuggingfaceHarvester
+from croissant_rdf.work_queue import WorkQueue
+
+
+def mock_croissant(dataset_id):
+    mock = MagicMock()
+    mock.json.return_value = {
+        "@context": {"name": "http://schema.org/name"},
+        "@id": dataset_id,
+        "name": dataset_id,
+    }
+    return mock
+
+
+def test_work_queue_lease(tmp_path):
+    queue_path = str(tmp_path / "queue.sqlite")
+    with WorkQueue(queue_path) as queue:
+        assert queue.enqueue([f"ds{i}" for i in range(5)], batch_size=2) == 3
+        assert queue.claim("w1") == (1, ["ds0", "ds1"])
+        assert queue.claim("w2") == (2, ["ds2", "ds3"])
+        # Expired lease can be reclaimed by another worker
+        batch_id, _ = queue.claim("w1", lease_seconds=-1)
+        assert queue.claim("w2") == (batch_id, ["ds4"])
+        assert not queue.complete(batch_id, "w1", "lost.nt")
+        assert queue.complete(batch_id, "w2", str(tmp_path / "shards" / "shard.nt"))
+        assert queue.claim("w3") is None
+        assert queue.counts() == {"pending": 0, "leased": 2, "done": 1, "failed": 0}
+        # Shards in the directory of the queue are recorded relative to it
+        assert queue.conn.execute("SELECT shard FROM batches WHERE status = 'done'").fetchone()[0] == "shards/shard.nt"
+    # The shared directory is mounted at another path for the merge
+    moved = tmp_path.with_name(f"{tmp_path.name}-moved")
+    os.rename(tmp_path, moved)
+    with WorkQueue(str(moved / "queue.sqlite"), create=False) as queue:
+        assert queue.shards() == [str(moved / "shards" / "shard.nt")]
+
+
+def test_distributed_harvest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    queue_path = str(tmp_path / "queue.sqlite")
+    shard_dir = "shards"
+    fname = str(tmp_path / "merged.ttl")
+    ids = [f"dataset_{i}" for i in range(5)]
+    with patch.object(HuggingfaceHarvester, "fetch_datasets_ids", return_value=ids), patch.object(
+        HuggingfaceHarvester, "fetch_dataset_croissant", side_effect=mock_croissant
+    ):
+        harvester = HuggingfaceHarvester(fname=fname)
+        assert harvester.enqueue_datasets(queue_path, batch_size=2) == 3
+        shards = harvester.work(queue_path, shard_dir, worker="w1")
+        # Queue is drained, a second worker has nothing left to do
+        assert harvester.work(queue_path, shard_dir, worker="w2") == []
+
+    assert len(shards) == 3
+    assert all(os.path.isfile(shard) and shard.endswith("-w1.nt") for shard in shards)
+    assert all(os.path.isabs(shard) for shard in shards)
+    with WorkQueue(queue_path) as queue:
+        assert queue.shards() == shards
+    # The merge runs from another directory than the worker
+    monkeypatch.chdir(tmp_path.parent)
+    harvester.merge_queue(queue_path)
+    g = Graph().parse(fname, format="ttl")
+    assert len(g) == 5
+
+
+def test_distributed_harvest_failed_batch(tmp_path):
+    queue_path = str(tmp_path / "queue.sqlite")
+    shard_dir = str(tmp_path / "shards")
+    ids = [f"dataset_{i}" for i in range(6)]
+
+    def mock_invalid_croissant(dataset_id):
+        mock = mock_croissant(dataset_id)
+        if dataset_id == "dataset_0":
+            mock.json.return_value = {"@context": 5, "name": dataset_id}
+        return mock
+
+    with patch.object(HuggingfaceHarvester, "fetch_datasets_ids", return_value=ids), patch.object(
+        HuggingfaceHarvester, "fetch_dataset_croissant", side_effect=mock_invalid_croissant
+    ):
+        harvester = HuggingfaceHarvester()
+        harvester.enqueue_datasets(queue_path, batch_size=2)
+        # The invalid batch is retried then skipped, the worker processes the other batches
+        shards = harvester.work(queue_path, shard_dir, worker="w1", max_attempts=2)
+
+    assert len(shards) == 2
+    with WorkQueue(queue_path) as queue:
+        assert queue.counts() == {"pending": 0, "leased": 0, "done": 2, "failed": 1}
+        attempts, error = queue.conn.execute("SELECT attempts, error FROM batches WHERE batch_id = 1").fetchone()
+        assert attempts == 2
+        assert error
+        assert queue.claim("w2") is None
+
+
+def test_distributed_harvest_fetch_errors(tmp_path):
+    queue_path = str(tmp_path / "queue.sqlite")
+    fname = str(tmp_path / "merged.ttl")
+    ids = [f"dataset_{i}" for i in range(6)]
+    calls = []
+
+    def mock_rate_limited(dataset_id):
+        calls.append(dataset_id)
+        # dataset_0 is rate limited once, dataset_3 to dataset_5 on every attempt
+        if (dataset_id == "dataset_0" and calls.count(dataset_id) == 1) or dataset_id in ids[3:]:
+            raise requests.HTTPError("429 Client Error: Too Many Requests")
+        return mock_croissant(dataset_id)
+
+    with patch.object(HuggingfaceHarvester, "fetch_datasets_ids", return_value=ids), patch.object(
+        HuggingfaceHarvester, "fetch_dataset_croissant", side_effect=mock_rate_limited
+    ):
+        harvester = HuggingfaceHarvester(fname=fname)
+        harvester.enqueue_datasets(queue_path, batch_size=2)
+        harvester.work(queue_path, str(tmp_path / "shards"), worker="w1", max_attempts=2)
+
+    with WorkQueue(queue_path) as queue:
+        # The last batch fetched nothing, the second one is completed without its failing dataset
+        assert queue.counts() == {"pending": 0, "leased": 0, "done": 2, "failed": 1}
+        assert queue.attempts(1) == 2
+        assert queue.missing() == ["dataset_3"]
+    harvester.merge_queue(queue_path)
+    assert len(Graph().parse(fname, format="ttl")) == 3
+
+
+def test_work_queue_expired_lease_max_attempts(tmp_path):
+    with WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=1) as queue:
+        queue.enqueue(["ds0"])
+        assert queue.claim("w1", lease_seconds=-1) == (1, ["ds0"])
+        # The worker died on the batch, it is not claimed again
+        assert queue.claim("w2") is None
+        assert queue.counts()["failed"] == 1
+
+
+def test_distributed_harvest_lost_lease(tmp_path):
+    queue_path = str(tmp_path / "queue.sqlite")
+    shard_dir = tmp_path / "shards"
+    with patch.object(HuggingfaceHarvester, "fetch_datasets_ids", return_value=["dataset_0"]), patch.object(
+        HuggingfaceHarvester, "fetch_dataset_croissant", side_effect=mock_croissant
+    ), patch.object(WorkQueue, "complete", return_value=False):
+        harvester = HuggingfaceHarvester()
+        harvester.enqueue_datasets(queue_path)
+        assert harvester.work(queue_path, str(shard_dir), worker="host/1") == []
+    # The shard of a worker that lost its lease is not left behind for the merge
+    assert list(shard_dir.iterdir()) == []
+
+
+def test_distributed_merge_unfinished(tmp_path):
+    queue_path = str(tmp_path / "queue.sqlite")
+    fname = str(tmp_path / "merged.ttl")
+    with WorkQueue(queue_path) as queue:
+        queue.enqueue(["ds0", "ds1"], batch_size=1)
+        # Enqueuing twice would harvest the same datasets twice
+        with pytest.raises(ValueError):
+            queue.enqueue(["ds0", "ds1"], batch_size=1)
+    harvester = HuggingfaceHarvester(fname=fname)
+    with pytest.raises(RuntimeError):
+        harvester.merge_queue(queue_path)
+    assert not os.path.isfile(fname)
+    harvester.merge_queue(queue_path, allow_partial=True)
+    assert os.path.isfile(fname)
+
+
+def test_distributed_missing_queue(tmp_path):
+    queue_path = str(tmp_path / "missing" / "queue.sqlite")
+    harvester = HuggingfaceHarvester(fname=str(tmp_path / "merged.ttl"))
+    # A wrong or unmounted queue path is not mistaken for an empty queue
+    with pytest.raises(FileNotFoundError):
+        harvester.work(queue_path, str(tmp_path / "shards"))
+    with pytest.raises(FileNotFoundError):
+        harvester.merge_queue(queue_path)
+    with pytest.raises(FileNotFoundError):
+        harvester.enqueue_datasets(queue_path)
+    assert not os.path.exists(tmp_path / "missing")
+    empty_path = str(tmp_path / "empty.sqlite")
+    WorkQueue(empty_path).close()
+    with pytest.raises(RuntimeError):
+        harvester.merge_queue(empty_path)
@@ -0,0 +1,83 @@
+import json
+import os
+
+import pytest
+from rdflib import Graph, URIRef
+
+from croissant_rdf.projection import Projection, get_projection
+from croissant_rdf.providers import KaggleHarvester
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(base_dir, "kaggle_croissant.json"), "r") as f:
+    test_metadata_kaggle = json.load(f)
+
+CR = "http://mlcommons.org/croissant/"
+
+
+def convert(tmp_path, profile):
+    fname = str(tmp_path / f"{profile}.ttl")
+    KaggleHarvester(fname=fname, profile=profile).convert_to_rdf([test_metadata_kaggle])
+    return Graph().parse(fname, format="ttl")
+
+
+def test_projection_catalog_only(tmp_path):
+    full = convert(tmp_path, "full")
+    catalog = convert(tmp_path, "catalog-only")
+    assert 0 < len(catalog) < len(full)
+    assert (None, URIRef(CR + "recordSet"), None) not in catalog
+    assert (None, URIRef(CR + "field"), None) not in catalog
+    assert (None, URIRef("https://schema.org/distribution"), None) in catalog
+    assert (None, URIRef("https://schema.org/keywords"), None) in catalog
+    # The input document is not modified
+    assert "recordSet" in test_metadata_kaggle[0]
+
+
+def test_projection_no_fields(tmp_path):
+    g = convert(tmp_path, "no-fields")
+    assert (None, URIRef(CR + "recordSet"), None) in g
+    assert (None, URIRef(CR + "field"), None) not in g
+
+
+def test_projection_drop_types():
+    doc = {
+        "@context": {"cr": CR},
+        "name": "test",
+        "cr:recordSet": [{"@type": "cr:RecordSet", "name": "rs"}, {"@type": "sc:Thing", "name": "other"}],
+    }
+    pruned = Projection(drop_types=["RecordSet"]).apply(doc)
+    assert pruned["cr:recordSet"] == [{"@type": "sc:Thing", "name": "other"}]
+    assert pruned["@context"] == {"cr": CR}
+
+
+def test_projection_graph():
+    doc = {
+        "@context": {"cr": CR},
+        "@graph": [
+            {"@type": "sc:Dataset", "name": "a", "cr:recordSet": [{"name": "rs"}]},
+            {"@type": "cr:RecordSet", "name": "rs"},
+        ],
+    }
+    pruned = get_projection("catalog-only").apply(doc)
+    # The properties kept on the root are applied to each node of the graph
+    assert pruned == {
+        "@context": {"cr": CR},
+        "@graph": [{"@type": "sc:Dataset", "name": "a"}, {"@type": "cr:RecordSet", "name": "rs"}],
+    }
+    pruned = Projection(drop_types=["RecordSet"]).apply(doc)
+    assert pruned["@graph"] == [doc["@graph"][0]]
+
+
+def test_projection_drop_root_type(tmp_path):
+    projection = Projection(drop_types=["RecordSet"])
+    assert projection.apply({"@type": "cr:RecordSet", "name": "rs"}) is None
+    assert projection.apply([{"@type": "cr:RecordSet"}, {"@type": "sc:Dataset"}]) == [{"@type": "sc:Dataset"}]
+    fname = str(tmp_path / "output.ttl")
+    harvester = KaggleHarvester(fname=fname)
+    harvester.projection = projection
+    harvester.convert_to_rdf([{"@context": {"@vocab": "https://schema.org/"}, "@type": "RecordSet", "name": "rs"}])
+    assert len(Graph().parse(fname, format="ttl")) == 0
+
+
+def test_projection_unknown_profile():
+    with pytest.raises(ValueError):
+        get_projection("unknown")
@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+from rdflib import Graph, URIRef
+
+from croissant_rdf.providers import KaggleHarvester
+from croissant_rdf.search_index import SearchIndex
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(base_dir, "kaggle_croissant.json"), "r") as f:
+    test_metadata_kaggle = json.load(f)
+
+
+def test_search_index(tmp_path):
+    fname = str(tmp_path / "output.ttl")
+    index_path = str(tmp_path / "search.sqlite")
+    other = {
+        "@context": {"@vocab": "https://schema.org/"},
+        "@type": "Dataset",
+        "url": "https://huggingface.co/datasets/org/proteins",
+        "name": "proteins",
+        "description": "Protein structures",
+        "keywords": ["biology", {"@value": "structure"}],
+    }
+    harvester = KaggleHarvester(fname=fname, search_index=index_path)
+    harvester.convert_to_rdf([test_metadata_kaggle, other])
+
+    iri = harvester.base_url + "huggingface.co/datasets/org/proteins"
+    g = Graph().parse(fname, format="ttl")
+    assert (URIRef(iri), URIRef("https://schema.org/name"), None) in g
+
+    with SearchIndex(index_path) as index:
+        assert len(index) == 2
+        assert [result[0] for result in index.search("biology")] == [iri]
+        assert [result[0] for result in index.search("keywords:struct*")] == [iri]
+        assert index.search("car")[0][0] != iri
+        assert index.search("nomatch") == []
+
+    # Entries are updated by IRI on the next conversion
+    harvester.convert_to_rdf([{**other, "keywords": ["chemistry"]}])
+    with SearchIndex(index_path) as index:
+        assert len(index) == 2
+        assert index.search("biology") == []
+        assert [result[0] for result in index.search("chemistry")] == [iri]
+
+
+def test_search_index_shared(tmp_path):
+    index_path = str(tmp_path / "search.sqlite")
+    base_url = "https://w3id.org/croissant-rdf/data/"
+    with SearchIndex(index_path, timeout=0.1, flush_size=2) as first, SearchIndex(index_path, timeout=0.1) as second:
+        first.add({"@id": "a", "name": "alpha"}, base_url)
+        # The first writer does not hold the lock while it buffers entries
+        second.add({"@id": "b", "name": "beta"}, base_url)
+        second.flush()
+        first.add({"@id": "c", "name": "gamma"}, base_url)
+        assert len(second) == 3
+
+
+def test_search_index_conversion_error(tmp_path):
+    index_path = str(tmp_path / "search.sqlite")
+    harvester = KaggleHarvester(fname=str(tmp_path / "output.ttl"), search_index=index_path)
+    with pytest.raises(Exception):  # noqa: B017
+        harvester.convert_to_rdf([{"@context": 5, "name": "invalid"}])
+    # The index is closed and not locked after a failed conversion
+    with SearchIndex(index_path, timeout=0.1) as index:
+        index.add({"@id": "a", "name": "alpha"}, harvester.base_url)
+        index.flush()
+        assert len(index) == 1
@@ -0,0 +1,71 @@
+import json
+import os
+
+from rdflib import Graph
+from rdflib.compare import isomorphic
+
+from croissant_rdf.providers import KaggleHarvester
+from croissant_rdf.turtle_writer import write_turtle
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(base_dir, "kaggle_croissant.json"), "r") as f:
+    test_metadata_kaggle = json.load(f)
+
+
+def test_parallel_turtle(tmp_path):
+    data = [test_metadata_kaggle]
+    for i in range(5):
+        data.append(
+            {
+                "@context": {"@vocab": "https://schema.org/", "ex": "http://example.org/vocab/"},
+                "@type": "Dataset",
+                "name": f"dataset_{i}",
+                "ex:size": i,
+                "creator": {"@type": "Person", "name": "Jane"},
+            }
+        )
+    serial = str(tmp_path / "serial.ttl")
+    parallel = str(tmp_path / "parallel.ttl")
+    KaggleHarvester(fname=serial, serialization_workers=1).convert_to_rdf(data)
+    KaggleHarvester(fname=parallel, serialization_workers=2).convert_to_rdf(data)
+
+    assert isomorphic(Graph().parse(serial, format="ttl"), Graph().parse(parallel, format="ttl"))
+    with open(parallel) as f:
+        lines = f.read().splitlines()
+    prefixes = [line for line in lines if line.startswith("@prefix")]
+    # One shared header, at the top of the file
+    assert lines[: len(prefixes)] == prefixes
+    assert len(prefixes) == len(set(prefixes))
+    assert "@prefix cr: <http://mlcommons.org/croissant/> ." in prefixes
+    assert "@prefix ex: <http://example.org/vocab/> ." in prefixes
+
+
+def test_write_turtle_partitions(tmp_path):
+    documents = [
+        Graph().parse(
+            data=json.dumps(
+                {
+                    "@context": {"@vocab": "https://schema.org/"},
+                    "name": f"dataset_{i}",
+                    "creator": {"@type": "Person", "name": f"creator_{i}"},
+                }
+            ),
+            format="json-ld",
+        )
+        for i in range(5)
+    ]
+    expected = Graph()
+    for doc in documents:
+        expected += doc
+    documents = [list(doc) for doc in documents]
+    fname = str(tmp_path / "output.ttl")
+    assert write_turtle(documents, fname, expected.namespace_manager, workers=2, partition_size=1) == 5
+    # Document graphs are released as their partition is submitted
+    assert documents == []
+    assert not os.path.exists(f"{fname}.body.tmp")
+    assert isomorphic(Graph().parse(fname, format="ttl"), expected)
+    # Partitions are written in the order of the documents
+    with open(fname) as f:
+        names = [line for line in f.read().splitlines() if '"dataset_' in line]
+    assert len(names) == 5
+    assert names == sorted(names)